@@ -0,0 +1,332 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+
+##
+# Differential harness comparing the legacy slicing code
+# with accelerated engines
+#
+# @author: Romain DURAND
+##
+
+import os
+import sys
+import random
+import time
+from Mesh import Mesh, Face
+from utils.math import Vec3d, Point, Plane
+from utils.stl_file import openStl
+
+EXAMPLE_STL = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                           os.pardir, "examples", "SanguinololuEnclosureBot_Doom.stl")
+
+
+def legacySlice(mesh, zValue):
+    """
+    Slice the mesh with the current object-based code.
+    :param mesh: Mesh
+    :param zValue: float  Height of the slicing plane.
+    :return: list<(Point, Point)>
+    """
+    plane = Plane(Vec3d(0, 0, 1), Point(0, 0, zValue))
+    segs = list()
+    for face in mesh.selectIntersectingFaces(zValue):
+        segs.extend(face.planeIntersection(plane))
+    return segs
+
+
+def exhaustiveSlice(mesh, zValue):
+    """
+    Slice the mesh by testing every face, without the sorted face lists.
+    Used to check the bisect boundaries of Mesh.selectIntersectingFaces.
+    :param mesh: Mesh
+    :param zValue: float  Height of the slicing plane.
+    :return: list<(Point, Point)>
+    """
+    plane = Plane(Vec3d(0, 0, 1), Point(0, 0, zValue))
+    segs = list()
+    for face in mesh.faces:
+        segs.extend(face.planeIntersection(plane))
+    return segs
+
+
+# Slicing engines: name -> callable(mesh, zValue) returning a list of segments.
+# A segment is a pair of points, each one being a Point, a Vec3d or a 3-tuple.
+ENGINES = {"legacy": legacySlice,
+           "exhaustive": exhaustiveSlice}
+
+# STL loaders: name -> callable(file) returning a list of triangles.
+LOADERS = {"legacy": openStl}
+
+
+def _pointTuple(p):
+    if p is None:
+        return None
+    if isinstance(p, (Point, Vec3d)):
+        return float(p.x), float(p.y), float(p.z)
+    return tuple(float(c) for c in p)
+
+
+def _closeTuples(a, b, tolerance):
+    if a is None or b is None:
+        return a is b
+    return all(abs(ca - cb) <= tolerance for ca, cb in zip(a, b))
+
+
+def _canonicalSegment(seg):
+    """
+    Turn a segment into a pair of tuples independent of its orientation.
+    """
+    p1, p2 = _pointTuple(seg[0]), _pointTuple(seg[1])
+    if p1 is None or p2 is None:
+        return p1, p2
+    return (p1, p2) if p1 <= p2 else (p2, p1)
+
+
+def _closeSegments(s1, s2, tolerance):
+    return ((_closeTuples(s1[0], s2[0], tolerance) and _closeTuples(s1[1], s2[1], tolerance)) or
+            (_closeTuples(s1[0], s2[1], tolerance) and _closeTuples(s1[1], s2[0], tolerance)))
+
+
+def _midpointCell(seg, size):
+    """
+    Grid cell of the segment midpoint. Segments within tolerance of each other
+    have their midpoints in the same or in neighbouring cells.
+    """
+    if seg[0] is None or seg[1] is None:
+        return None
+    return tuple(int((a + b) / 2 // size) for a, b in zip(seg[0], seg[1]))
+
+
+def diffSegments(expected, actual, tolerance=1e-6):
+    """
+    Compare two segment sets as multisets, matching segments within tolerance
+    whatever their orientation.
+    :param expected: list<segment>
+    :param actual: list<segment>
+    :param tolerance: float  Maximum absolute difference per coordinate.
+    :return: missing, extra  Segments only found in expected, resp. actual.
+    """
+    size = max(tolerance, 1e-12)
+    remaining = dict()
+    for seg in map(_canonicalSegment, actual):
+        remaining.setdefault(_midpointCell(seg, size), []).append(seg)
+
+    missing = list()
+    for seg in map(_canonicalSegment, expected):
+        cell = _midpointCell(seg, size)
+        if cell is None:
+            neighbours = [None]
+        else:
+            neighbours = [(cell[0] + i, cell[1] + j, cell[2] + k)
+                          for i in (-1, 0, 1) for j in (-1, 0, 1) for k in (-1, 0, 1)]
+        found = False
+        for n in neighbours:
+            candidates = remaining.get(n, [])
+            for i, other in enumerate(candidates):
+                if _closeSegments(seg, other, tolerance):
+                    del candidates[i]
+                    found = True
+                    break
+            if found:
+                break
+        if not found:
+            missing.append(seg)
+    return missing, [seg for segs in remaining.values() for seg in segs]
+
+
+def vertexHeights(mesh, maxCount=None):
+    """
+    Every distinct vertex height, so that planes go exactly through vertices,
+    edges and coplanar faces.
+    :param mesh: Mesh
+    :param maxCount: int  If set, evenly sample at most maxCount heights.
+    :return: list<float>
+    """
+    heights = sorted({v.z for f in mesh.faces for v in (f.v1, f.v2, f.v3)})
+    if maxCount is not None and len(heights) > maxCount:
+        step = len(heights) / maxCount
+        heights = [heights[int(i * step)] for i in range(maxCount)]
+    return heights
+
+
+def layerHeights(mesh, layerHeight):
+    """
+    Regular layer heights from the bottom to the top of the mesh, both included.
+    :param mesh: Mesh
+    :param layerHeight: float
+    :return: list<float>
+    """
+    zs = [v.z for f in mesh.faces for v in (f.v1, f.v2, f.v3)]
+    zmin, zmax = min(zs), max(zs)
+    n = int((zmax - zmin) / layerHeight)
+    return [zmin + i * layerHeight for i in range(n + 1)] + [zmax]
+
+
+def compareEngines(mesh, heights, engines=None, reference="legacy", tolerance=1e-6):
+    """
+    Slice the mesh at every height with each engine and compare the segment
+    sets with those of the reference engine.
+    :param mesh: Mesh
+    :param heights: list<float>
+    :param engines: dict<str, callable>  Defaults to ENGINES.
+    :param reference: str  Name of the engine used as reference.
+    :param tolerance: float
+    :return: dict  name -> {"time", "speedup", "mismatches": list<(z, missing, extra)>}
+    """
+    if engines is None:
+        engines = ENGINES
+    if reference not in engines:
+        raise KeyError("Unknown reference engine ", reference)
+
+    results = dict()
+    for name, engine in engines.items():
+        layers = list()
+        start = time.perf_counter()
+        for z in heights:
+            layers.append(engine(mesh, z))
+        results[name] = {"time": time.perf_counter() - start, "layers": layers}
+
+    refTime = results[reference]["time"]
+    refLayers = results[reference]["layers"]
+    report = dict()
+    for name, res in results.items():
+        mismatches = list()
+        if name != reference:
+            for z, expected, actual in zip(heights, refLayers, res["layers"]):
+                missing, extra = diffSegments(expected, actual, tolerance)
+                if missing or extra:
+                    mismatches.append((z, missing, extra))
+        report[name] = {"time": res["time"],
+                        "speedup": refTime / res["time"] if res["time"] > 0 else float("inf"),
+                        "mismatches": mismatches}
+    return report
+
+
+def compareLoaders(file, loaders=None, reference="legacy", tolerance=1e-6):
+    """
+    Load an STL file with each loader and compare the triangles with those
+    of the reference loader.
+    :param file: str
+    :param loaders: dict<str, callable>  Defaults to LOADERS.
+    :param reference: str
+    :param tolerance: float
+    :return: dict  name -> {"time", "speedup", "mismatches": list<index>}
+    """
+    if loaders is None:
+        loaders = LOADERS
+    if reference not in loaders:
+        raise KeyError("Unknown reference loader ", reference)
+
+    results = dict()
+    for name, loader in loaders.items():
+        start = time.perf_counter()
+        triangles = loader(file)
+        results[name] = {"time": time.perf_counter() - start, "triangles": triangles}
+
+    refTime = results[reference]["time"]
+    refTriangles = results[reference]["triangles"]
+    report = dict()
+    for name, res in results.items():
+        mismatches = list()
+        if name != reference:
+            triangles = res["triangles"]
+            if len(triangles) != len(refTriangles):
+                mismatches.append(len(refTriangles))
+            for i, (expected, actual) in enumerate(zip(refTriangles, triangles)):
+                if not all(_closeTuples(_pointTuple(e), _pointTuple(a), tolerance)
+                           for e, a in zip(expected, actual)):
+                    mismatches.append(i)
+        report[name] = {"time": res["time"],
+                        "speedup": refTime / res["time"] if res["time"] > 0 else float("inf"),
+                        "mismatches": mismatches}
+    return report
+
+
+def cubeMesh(size=1.0):
+    """
+    Axis-aligned cube standing on z = 0: horizontal faces are coplanar with
+    the bottom and top layers, and every vertex lies on one of them.
+    :return: Mesh
+    """
+    s = size
+    c = [Vec3d(x, y, z) for z in (0, s) for y in (0, s) for x in (0, s)]
+    quads = [(0, 2, 3, 1), (4, 5, 7, 6), (0, 1, 5, 4),
+             (2, 6, 7, 3), (0, 4, 6, 2), (1, 3, 7, 5)]
+    faces = list()
+    for a, b, d, e in quads:
+        faces.append(Face(Vec3d(c[a].x, c[a].y, c[a].z), Vec3d(c[b].x, c[b].y, c[b].z),
+                          Vec3d(c[d].x, c[d].y, c[d].z)))
+        faces.append(Face(Vec3d(c[a].x, c[a].y, c[a].z), Vec3d(c[d].x, c[d].y, c[d].z),
+                          Vec3d(c[e].x, c[e].y, c[e].z)))
+    return Mesh("Cube").addFaces(faces)
+
+
+def stairsMesh(steps=4, height=0.5):
+    """
+    Horizontal triangles stacked at regular heights, plus faces with a single
+    vertex or a single edge at each of those heights.
+    :return: Mesh
+    """
+    faces = list()
+    for i in range(steps):
+        z = i * height
+        faces.append(Face(Vec3d(0, 0, z), Vec3d(1, 0, z), Vec3d(0, 1, z)))
+        faces.append(Face(Vec3d(2, 0, z), Vec3d(3, 0, z + height), Vec3d(2, 1, z + height)))
+        faces.append(Face(Vec3d(4, 0, z), Vec3d(5, 0, z), Vec3d(4, 1, z + height)))
+        faces.append(Face(Vec3d(6, 0, z - height), Vec3d(7, 0, z), Vec3d(6, 1, z + height)))
+    return Mesh("Stairs").addFaces(faces)
+
+
+def randomMesh(count=200, seed=0, grid=0.25):
+    """
+    Random triangles whose coordinates are snapped on a grid, so that many
+    vertices fall exactly on the slicing planes.
+    :return: Mesh
+    """
+    rand = random.Random(seed)
+
+    def vertex():
+        return Vec3d(*(rand.randint(0, 40) * grid for _ in range(3)))
+
+    return Mesh("Random").addFaces([Face(vertex(), vertex(), vertex()) for _ in range(count)])
+
+
+def generatedMeshes():
+    return [cubeMesh(), stairsMesh(), randomMesh()]
+
+
+def printReport(title, report):
+    print(title)
+    for name, res in report.items():
+        status = "OK" if not res["mismatches"] else "%d MISMATCHES" % len(res["mismatches"])
+        print("  %-12s %9.4fs  x%-7.2f %s" % (name, res["time"], res["speedup"], status))
+
+
+def run(files, layerHeight=0.2, maxVertexHeights=200, tolerance=1e-6):
+    """
+    Compare every registered engine and loader on the generated meshes
+    and the given STL files.
+    :return: bool  True if no mismatch was found.
+    """
+    ok = True
+    meshes = generatedMeshes()
+    for file in files:
+        report = compareLoaders(file, tolerance=tolerance)
+        printReport("Loaders on " + file, report)
+        ok = ok and not any(res["mismatches"] for res in report.values())
+        meshes.append(Mesh(os.path.basename(file), file))
+
+    for mesh in meshes:
+        heights = sorted(set(vertexHeights(mesh, maxVertexHeights) + layerHeights(mesh, layerHeight)))
+        report = compareEngines(mesh, heights, tolerance=tolerance)
+        printReport("Engines on %s (%d faces, %d layers)" % (mesh.name, len(mesh.faces), len(heights)),
+                    report)
+        for name, res in report.items():
+            for z, missing, extra in res["mismatches"]:
+                print("    %s z=%r: %d missing, %d extra" % (name, z, len(missing), len(extra)))
+        ok = ok and not any(res["mismatches"] for res in report.values())
+    return ok
+
+
+if __name__ == '__main__':
+    sys.exit(0 if run(sys.argv[1:] or [EXAMPLE_STL]) else 1)